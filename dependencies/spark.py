@@ -14,6 +14,17 @@ from pyspark.sql import SparkSession
 
 from dependencies import logging
 
+# adaptive query execution settings applied to local (REPL/debug) sessions, so the shuffle partitions are sized from
+# the data rather than the fixed spark.sql.shuffle.partitions. Jobs started with spark-submit get them as --conf
+# options (see run_tree_analytics_job.sh). Spark 2.4 only reads the first two keys, the skew join and partition
+# coalescing keys take effect from Spark 3.0 onwards
+ADAPTIVE_SPARK_CONFIG = {
+    'spark.sql.adaptive.enabled': 'true',
+    'spark.sql.adaptive.shuffle.targetPostShuffleInputSize': '64m',
+    'spark.sql.adaptive.coalescePartitions.enabled': 'true',
+    'spark.sql.adaptive.skewJoin.enabled': 'true',
+    'spark.sql.adaptive.advisoryPartitionSizeInBytes': '64m'}
+
 
 def start_spark(app_name='sf_tree_distribution_job', master='local[*]',
                 files=[], spark_config={}):
@@ -53,7 +64,10 @@ def start_spark(app_name='sf_tree_distribution_job', master='local[*]',
         spark_files = ','.join(list(files))
         spark_builder.config('spark.files', spark_files)
 
-        # add other config params
+        # enable adaptive query execution, then add other config params so they can override it
+        for key, val in ADAPTIVE_SPARK_CONFIG.items():
+            spark_builder.config(key, val)
+
         for key, val in spark_config.items():
             spark_builder.config(key, val)
 
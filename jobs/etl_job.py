@@ -19,18 +19,49 @@ where,
 
 """
 
-from pyspark.sql.functions import col, desc, rank, split
-from pyspark.sql.window import Window
+from pyspark import StorageLevel
+from pyspark.sql.functions import col, count, desc, length, lit, substring_index, when
+from pyspark.sql.types import IntegerType, StringType, StructField, StructType
 
 from dependencies.spark import start_spark
 
+# explicit schema of san_francisco_street_trees.csv, the CSV reader applies it by position so every column of the
+# file is listed in the order of the header
+TREE_SCHEMA = StructType([
+    StructField('address', StringType()),
+    StructField('care_assistant', StringType()),
+    StructField('care_taker', StringType()),
+    StructField('dbh', StringType()),
+    StructField('latitude', StringType()),
+    StructField('legal_status', StringType()),
+    StructField('location', StringType()),
+    StructField('longitude', StringType()),
+    StructField('permit_notes', StringType()),
+    StructField('plant_date', StringType()),
+    StructField('plant_type', StringType()),
+    StructField('plot_size', StringType()),
+    StructField('site_info', StringType()),
+    StructField('site_order', StringType()),
+    StructField('species', StringType()),
+    StructField('tree_id', IntegerType()),
+    StructField('x_coordinate', StringType()),
+    StructField('y_coordinate', StringType())])
+
 
 class TreeDistributionAnalyzer:
 
-    # start Spark application and get Spark session, logger and config
-    spark, log, config = start_spark(
-        app_name='sf_tree_distribution_job',
-        files=['configs/etl_config.json'])
+    def __init__(self, app_name='sf_tree_distribution_job'):
+        """Start Spark application and get Spark session, logger and config
+
+        :param app_name: Name of Spark app.
+        """
+        self.spark, self.log, self.config = start_spark(
+            app_name=app_name,
+            files=['configs/etl_config.json'])
+
+        # column expressions of the analysed columns, built once and shared by all the analyses
+        self.columns = {name: col(name)
+                        for name in ('species', 'address', 'legal_status', 'permit_notes', 'tree_type')}
 
     def main(self):
         """Main ETL script definition.
@@ -47,21 +78,37 @@ class TreeDistributionAnalyzer:
         # execute ETL pipeline to read the input data
         data = self.extract_input_data(self.spark, self.config)
 
-        # find most commonly occurred trees
-        most_common_trees = self.find_most_common_trees(data)
-        self.save_output_data(most_common_trees, self.config['output-dir'] + "/most_common_trees")
+        # keep only the columns used by the analyses along with the derived tree type and persist them, so the CSV is
+        # parsed once instead of per action
+        data = (self.add_tree_type(data.select('species', 'address', 'legal_status', 'permit_notes'))
+            .persist(StorageLevel.MEMORY_AND_DISK))
+
+        # find most commonly occurred trees, each analysis only receives the columns it needs
+        most_common_trees = self.find_most_common_trees(data.select('tree_type'))
+        self.save_output_data(most_common_trees, self.config['output-dir'] + "/most_common_trees",
+                              single_file=True)
 
         # find the address with maximum number of trees planted
-        most_trees_in_location = self.find_most_trees_address(data)
-        self.save_output_data(most_trees_in_location, self.config['output-dir'] + "/most_trees_in_location")
+        most_trees_in_location = self.find_most_trees_address(data.select('address'))
+        self.save_output_data(most_trees_in_location, self.config['output-dir'] + "/most_trees_in_location",
+                              single_file=True)
 
-        # find number of Banyan trees which has a permit number
-        count_banyan_trees = self.create_output_dataframe(self.find_banyan_trees(data))
-        self.save_output_data(count_banyan_trees, self.config['output-dir'] + "/count_banyan_trees")
+        # find number of Banyan trees which has a permit number and the Plum trees which are DPW maintained in a
+        # single pass, the one row result is cached so that both outputs are written from it
+        tree_counts = self.count_banyan_and_plum_trees(
+            data.select('species', 'permit_notes', 'legal_status')).cache()
 
-        # find the Plum trees which are DPW maintained
-        count_plum_trees = self.find_plum_trees(data)
-        self.save_output_data(count_plum_trees, self.config['output-dir'] + "/count_plum_trees")
+        count_banyan_trees = tree_counts.select('BanyanTreeCount')
+        self.save_output_data(count_banyan_trees, self.config['output-dir'] + "/count_banyan_trees",
+                              single_file=True)
+
+        count_plum_trees = tree_counts.select('CherryPlumTrees')
+        self.save_output_data(count_plum_trees, self.config['output-dir'] + "/count_plum_trees",
+                              single_file=True)
+
+        tree_counts.unpersist()
+
+        data.unpersist()
 
         # log the success and terminate Spark application
         self.log.warn('test_etl_job is finished')
@@ -70,7 +117,7 @@ class TreeDistributionAnalyzer:
 
 
     def extract_input_data(self, spark, config):
-        """Load data from CSV file format.
+        """Load data from CSV file format using the explicit tree schema, instead of inferring it from the data.
 
         :param spark: Spark session object.
         :param config: Job configurations
@@ -78,7 +125,7 @@ class TreeDistributionAnalyzer:
         """
 
         df = (spark.read.format(config['input-file-format'])
-            .option("inferSchema",config['infer-schema'])
+            .schema(TREE_SCHEMA)
             .option("header", config['input-header'])
             .option("sep", config['input-delimiter'])
             .load(config['input-dir']))
@@ -93,38 +140,45 @@ class TreeDistributionAnalyzer:
         :return: DataFrame of the address with most number of trees
         """
 
-        # dataframe of address and corresponding tree_id(s) and find the total count of trees in each address
-        max_trees = df.select('address', 'tree_id').filter(df.address.isNotNull()).groupBy(col('address')).count().sort(
-            desc("count"))
+        # drop the trees without address before anything else and find the total count of trees in each address, keyed
+        # on the address column alone so the partial aggregation only shuffles one row per address and partition
+        max_trees = (df.filter(self.columns['address'].isNotNull()).groupBy('address')
+            .agg(count(lit(1)).alias('count')))
 
-        # rank the addresses based on decreasing order of number of trees planted and find top address, which is rank 1
-        max_trees_place = max_trees.withColumn("rank", rank().over(Window.orderBy(col("count").desc()))).filter(
-            col("rank") == 1).select('address')
+        # take the top address in decreasing order of number of trees planted, a top-N limit avoids ranking every
+        # address in a single partition. Ties are broken by address, so the result does not depend on the partitioning
+        max_trees_place = max_trees.orderBy(desc("count"), 'address').limit(1).select('address')
 
         self.log.warn('Found the address with most number of trees planted')
 
         return max_trees_place
 
-    def find_most_common_trees(self, df):
-        """Find the top 5 most commonly occurred tree  types in San Francisco area
+    def add_tree_type(self, df):
+        """Add the tree sub type of the species as the `tree_type` column
 
         :param df: Input DataFrame containing all details of trees
-        :return: Dataframe of top 5 common tree types
+        :return: DataFrame of the trees with their tree type
         """
 
-        # create split rule to find the tree sub type
-        split_col = split(df['species'], '::')
+        # The `species` is in the format of <Type::Subtype>, the tree sub type is the part after '::' and it is null for
+        # the species without a sub type
+        return df.withColumn('tree_type', when(self.columns['species'].contains('::'),
+                                               substring_index(self.columns['species'], '::', -1)))
 
-        # a dataframe of trees with only required fields
-        comm_trees = df.select('species', 'tree_id').withColumn('tree_type', split_col.getItem(1))
+    def find_most_common_trees(self, df):
+        """Find the top 5 most commonly occurred tree  types in San Francisco area
+
+        :param df: Input DataFrame containing all details of trees, along with their tree type from add_tree_type()
+        :return: Dataframe of top 5 common tree types
+        """
 
         # filter out the trees with no or unknown sub types and get the count of valid sub types
-        comm_tree_df = (comm_trees.select('tree_type').filter(col('tree_type') != '').groupBy('tree_type').count()
-            .orderBy(col('count').desc()))
+        comm_tree_df = (df.select('tree_type').filter(self.columns['tree_type'] != '')
+            .groupBy('tree_type').count())
 
-        # find the top 5 commonly occured tree types by using ranking
-        most_comm_trees = comm_tree_df.withColumn("rank", rank().over(Window.orderBy(col("count").desc()))).filter(
-            col("rank") <= 5).select('tree_type', 'count')
+        # find the top 5 commonly occured tree types by taking the first 5 in decreasing order of count, ties are
+        # broken by tree type so the result does not depend on the partitioning
+        most_comm_trees = comm_tree_df.orderBy(desc("count"), 'tree_type').limit(5).select('tree_type', 'count')
 
         self.log.warn('Found the top 5 most common trees in San Francisco')
 
@@ -133,6 +187,9 @@ class TreeDistributionAnalyzer:
     def find_plum_trees(self, df):
         """Find the number of `Cherry Plum` trees which are `DPW Maintained`
 
+        The ETL pipeline counts these trees with count_banyan_and_plum_trees(), both share the
+        is_dpw_maintained_plum_tree() condition.
+
         :param df: Input DataFrame containing all details of trees
         :return: DataFrame of count of plum trees
         """
@@ -140,15 +197,10 @@ class TreeDistributionAnalyzer:
         """The `species` is in the format of <Type::Subtype>, then find the sub type by splitting it and filter on the 
         subtype to match the cherry plum subtype. Also check if the tree is DPW maintained.
         """
-        plum_trees = (df.select('species', 'tree_id').filter(
-            col('species').contains('Cherry Plum') & col('legal_status').like('DPW Maintained')))
-
-        # find the total of trees in each cherry plum tree types
-        plum_trees_df = plum_trees.select('species').groupBy('species').count()
+        plum_trees = df.select('species', 'legal_status').filter(self.is_dpw_maintained_plum_tree())
 
-        # find the total number of cherry plum trees by summing up from the individual sub type categories
-        total_plum_trees = ((plum_trees_df.groupBy().sum().alias('plum')).
-            withColumnRenamed('sum(count)', 'CherryPlumTrees'))
+        # find the total number of cherry plum trees in a single aggregation across all the sub type categories
+        total_plum_trees = plum_trees.agg(count(lit(1)).alias('CherryPlumTrees'))
 
         self.log.warn('Found number of plum trees which are DPW Maintained')
 
@@ -157,40 +209,91 @@ class TreeDistributionAnalyzer:
     def find_banyan_trees(self, df):
         """Find the number of Banyan trees which are assigned a permit number
 
+        The ETL pipeline counts these trees with count_banyan_and_plum_trees(), both share the
+        is_banyan_tree_with_permit() condition.
+
         :param df: Input DataFrame containing all details of trees
         :return: DataFrame of banyan trees
         """
 
         # The DF is filtered to match all the species of Banyan tree and if the tree has proper permit number
-        banyan_tree = (df.select('species', 'permit_notes').filter(col('species').like('%Banyan Fig%') & col('permit_notes').rlike('\w+\s?\w+\s?\d+')))
+        banyan_tree = df.select('species', 'permit_notes').filter(self.is_banyan_tree_with_permit())
 
         self.log.warn('Found number of Banyan trees which has a permit number')
 
         return banyan_tree
 
-    def save_output_data(self, df, outfile_name):
-        """Collect data and write to CSV to the specified output directory as a single CSV file.
+    def count_banyan_and_plum_trees(self, df):
+        """Find the number of Banyan trees which are assigned a permit number and the number of `Cherry Plum` trees
+        which are `DPW Maintained`, in a single scan of the input
+
+        :param df: Input DataFrame containing all details of trees
+        :return: DataFrame of count of banyan trees and count of plum trees
+        """
+
+        # count the rows matching each condition with conditional aggregates, instead of filtering the DF twice
+        tree_counts = df.agg(
+            count(when(self.is_banyan_tree_with_permit(), 1)).alias('BanyanTreeCount'),
+            count(when(self.is_dpw_maintained_plum_tree(), 1)).alias('CherryPlumTrees'))
+
+        self.log.warn('Found number of Banyan trees which has a permit number and plum trees which are DPW Maintained')
+
+        return tree_counts
+
+    def is_banyan_tree_with_permit(self):
+        """Condition matching the Banyan trees which are assigned a permit number
+
+        :return: Column of the filter condition
+        """
+
+        # The checks are ordered cheapest first, null checks, then the substring search and the regex last.
+        # The permit pattern matches exactly the same notes as '\w+\s?\w+\s?\d+', without the nested quantifiers
+        # that make the regex engine backtrack on long notes. It needs at least 3 characters, so the notes which are
+        # missing or shorter are dropped by the cheap checks before the regex is evaluated
+        return (self.columns['species'].isNotNull() & self.columns['permit_notes'].isNotNull()
+                & self.columns['species'].contains('Banyan Fig') & (length(self.columns['permit_notes']) >= 3)
+                & self.columns['permit_notes'].rlike(r'\w\s?\w\s?\d'))
+
+    def is_dpw_maintained_plum_tree(self):
+        """Condition matching the `Cherry Plum` trees which are `DPW Maintained`
+
+        :return: Column of the filter condition
+        """
+
+        # The checks are ordered cheapest first, null checks, then the equality and the substring search last
+        return (self.columns['species'].isNotNull() & self.columns['legal_status'].isNotNull()
+                & (self.columns['legal_status'] == 'DPW Maintained') & self.columns['species'].contains('Cherry Plum'))
+
+    def save_output_data(self, df, outfile_name, single_file=False, fmt='csv'):
+        """Collect data and write to the specified output directory, as a single file if requested.
 
         :param df: Input DataFrame containing all details of trees
         :param outfile_name: The output directory location
+        :param single_file: Write a single file, only meant for small outputs as it is written by one task
+        :param fmt: Output file format, CSV with header by default, `parquet` for outputs read by other jobs
         :return: None
         """
 
-        # save the result as a sing csv file with header
-        (df
-         .coalesce(1)
-         .write
-         .csv(outfile_name, mode="overwrite", header=True))
+        # small outputs are collapsed in to a single file
+        if single_file:
+            df = df.coalesce(1)
+
+        writer = df.write.format(fmt).mode("overwrite")
+        if fmt == 'csv':
+            writer = writer.option("header", True)
+
+        writer.save(outfile_name)
         return None
 
     def create_output_dataframe(self, df):
-        """This is a utility for code modularity
+        """This is a utility for code modularity, the ETL pipeline takes the count of banyan trees from
+        count_banyan_and_plum_trees() instead.
 
-        :param df: Input DataFrame containing all details of trees
-        :param outfile_name: The output directory location
-        :return: None
+        :param df: DataFrame of banyan trees
+        :return: DataFrame of count of banyan trees
         """
-        banyan_tree_count = self.spark.createDataFrame([[df.count()]]).withColumnRenamed('_1', 'BanyanTreeCount')
+        # count as an aggregation, so the count is computed on the executors instead of being collected to the driver
+        banyan_tree_count = df.agg(count(lit(1)).alias('BanyanTreeCount'))
         return banyan_tree_count
 
 
@@ -28,6 +28,11 @@ echo $SPARK_HOME
 
 source $SPARK_HOME/bin/spark-submit \
 --master $spark_url \
+--conf spark.sql.adaptive.enabled=true \
+--conf spark.sql.adaptive.shuffle.targetPostShuffleInputSize=64m \
+--conf spark.sql.adaptive.coalescePartitions.enabled=true \
+--conf spark.sql.adaptive.skewJoin.enabled=true \
+--conf spark.sql.adaptive.advisoryPartitionSizeInBytes=64m \
 --py-files packages.zip \
 --files configs/etl_config.json \
 jobs/etl_job.py
@@ -10,39 +10,43 @@ import unittest
 
 import json
 
-from jobs.etl_job import TreeDistributionAnalyzer
+from jobs.etl_job import TREE_SCHEMA, TreeDistributionAnalyzer
 
 
 class SparkETLTests(unittest.TestCase):
     """Test suite for tree analytics in etl_job.py
     """
 
-    def setUp(self):
-        """Start Spark, define config, master input data frame and path to test data
+    @classmethod
+    def setUpClass(cls):
+        """Start Spark once for the test suite, define config, master input data frame and path to test data
         """
-        self.config = json.loads("""{  "input-file-format": "csv",
+        cls.config = json.loads("""{  "input-file-format": "csv",
           "input-dir": "/Users/arunvasu/Downloads/san_francisco_street_trees.csv",
           "output-dir": "/Users/arunvasu/Downloads/tree-distributions",
           "input-delimiter": ",",
-          "input-header": "true",
-          "infer-schema": "true"}""")
-        self.test_data_path = 'tests/test-data/'
-        self.test_data_validation_path = 'tests/test-data/validation-data/'
-        self.executor = TreeDistributionAnalyzer()
+          "input-header": "true"}""")
+        cls.test_data_path = 'tests/test-data/'
+        cls.test_data_validation_path = 'tests/test-data/validation-data/'
+        cls.executor = TreeDistributionAnalyzer()
 
-        self.input_data = (
-            self.executor.spark
+        cls.input_data = cls.executor.add_tree_type(
+            cls.executor.spark
                 .read
-                .option("inferSchema", "true")
+                .schema(TREE_SCHEMA)
                 .option("header", "true")
                 .option("sep", ",")
                 .option("isDirectory", "true")
-                .csv(self.test_data_path + 'input-data'))
+                .csv(cls.test_data_path + 'input-data')).cache()
+
+        # materialize the cache before the first test runs
+        cls.input_data.count()
 
-    def tearDown(self):
+    @classmethod
+    def tearDownClass(cls):
         """Stop Spark
         """
-        #self.executor.spark.stop()
+        cls.executor.spark.stop()
 
 
     def test_find_banyan_trees(self):
@@ -100,6 +104,44 @@ class SparkETLTests(unittest.TestCase):
         actual_count = data_transformed.select('CherryPlumTrees').collect()
         self.assertEqual((exp_count),(actual_count))
 
+    def test_count_banyan_and_plum_trees(self):
+        """Test count_banyan_and_plum_trees()
+
+        Using small chunks of input data and expected output data, we
+        test the count_banyan_and_plum_trees() method to make sure it's working as
+        expected.
+        """
+
+        expected_banyan_data = (
+            self.executor.spark
+            .read
+            .option("inferSchema", "true")
+            .option("header", "true")
+            .option("sep", ",")
+            .option("isDirectory", "true")
+            .csv(self.test_data_validation_path + 'find_banyan_trees'))
+
+        expected_plum_data = (
+            self.executor.spark
+            .read
+            .option("inferSchema", "true")
+            .option("header", "true")
+            .option("sep", ",")
+            .option("isDirectory", "true")
+            .csv(self.test_data_validation_path + 'find_plum_trees'))
+
+        data_transformed = self.executor.count_banyan_and_plum_trees(self.input_data)
+        data_transformed.show(truncate=False)
+
+        self.assertEqual(expected_banyan_data.columns + expected_plum_data.columns, data_transformed.columns)
+        self.assertEqual(1, data_transformed.count())
+        exp_count = expected_banyan_data.select('BanyanTreeCount').collect()
+        actual_count = data_transformed.select('BanyanTreeCount').collect()
+        self.assertEqual((exp_count),(actual_count))
+        exp_count = expected_plum_data.select('CherryPlumTrees').collect()
+        actual_count = data_transformed.select('CherryPlumTrees').collect()
+        self.assertEqual((exp_count),(actual_count))
+
     def test_find_most_common_trees(self):
         """Test find_most_common_trees()
 